@@ -1,18 +1,49 @@
-import random
+import json
 import re
-from typing import List
+import numpy as np
+from typing import Dict, List, Optional, Tuple
 from src.services.name_service import NameService
-from openai import OpenAI
+from src.services.batch_service import MicroBatcher
+import httpx
+from openai import AsyncOpenAI
 import os 
 import logging
 logger = logging.getLogger(__name__)
 
+RANDOM_BATCH = 64
+
+_CLEAN_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+
+class _KeepAlnumTable(dict):
+    """str.translate table that keeps ASCII letters/digits and drops everything else."""
+    
+    def __missing__(self, codepoint: int):
+        char = chr(codepoint)
+        self[codepoint] = char if char.isascii() and char.isalnum() else None
+        return self[codepoint]
+
+
+_LOWER_UNDERSCORE = str.maketrans({' ': '_'})
+_LOWER_DOT = str.maketrans({' ': '.'})
+_STRIP_SPACE = str.maketrans('', '', ' ')
+_KEEP_ALNUM = _KeepAlnumTable()
+
 class CreatorAgent:
     """AI-powered agent responsible for creating username candidates."""
     
-    def __init__(self, name_service: NameService):
+    _PREFIXES = ('the', 'mr', 'ms', 'dr', 'prof')
+    _SUFFIXES = ('_official', '_real', '_pro', '_user', '_dev')
+    _YEARS = (2020, 2021, 2022, 2023, 2024)
+    _X_SUFFIXES = ('x', 'z', 'pro', '007', 'tech', 'dev')
+    _CREATIVE_WORDS = ('cool', 'super', 'mega', 'ultra', 'prime')
+    
+    def __init__(self, name_service: NameService, http_client: Optional[httpx.AsyncClient] = None):
         self.name_service = name_service
-        self.client = OpenAI(base_url = os.getenv("OPENAI_BASE_URL"))
+        self.client = AsyncOpenAI(base_url = os.getenv("OPENAI_BASE_URL"), http_client = http_client)
+        self._ai_batcher = MicroBatcher(self._generate_ai_usernames_batch)
+        self._rng = np.random.default_rng()
+        self._draws: List[float] = []
         self.rules = [
             self._add_underscore,
             self._add_numbers,
@@ -25,40 +56,79 @@ class CreatorAgent:
             self._add_random_suffix
         ]
     
-    def create_usernames(self, input_name: str) -> List[str]:
+    async def create_usernames(self, input_name: str) -> List[str]:
         """
-        Create 10-12 username candidates using AI and rules.
+        Create 10-12 username candidates using rules only (no AI call).
         """
         # Get English version of the name
-        english_name = self.name_service.get_english_name(input_name)
+        english_name = await self.name_service.aget_english_name(input_name)
         logger.info(f"found english name: {english_name}")
-        usernames = []
-        
-        # Generate AI-powered creative usernames (5-6 usernames)
-        ai_usernames = self._generate_ai_usernames(english_name)
-        usernames.extend(ai_usernames)
-        
-        # Apply traditional rules (4-5 usernames) 
-        rule_usernames = self._generate_rule_based_usernames(english_name)
-        usernames.extend(rule_usernames)
         
-        # Remove duplicates and ensure we have 10-12 candidates
-        unique_usernames = list(dict.fromkeys(usernames))
+        # Rule-based (4-5 usernames) then creative variations (3-4 usernames),
+        # de-duplicated as they are added
+        seen = set()
+        unique_usernames = []
+        for username in self._generate_rule_based_usernames(english_name) + self._generate_creative_usernames(english_name):
+            if username and username not in seen:
+                seen.add(username)
+                unique_usernames.append(username)
         
         # If we have fewer than 10, add more variations
-        base_name = english_name.lower().replace(' ', '')
+        base_name = english_name.translate(_STRIP_SPACE).lower()
         while len(unique_usernames) < 10:
             variation = self._create_variation(base_name)
-            if variation not in unique_usernames:
+            if variation not in seen:
+                seen.add(variation)
                 unique_usernames.append(variation)
         
         return unique_usernames[:12]
     
-    def _generate_ai_usernames(self, name: str) -> List[str]:
+    async def augment_usernames(self, input_name: str, count: int, exclude: List[str]) -> List[str]:
+        """
+        Ask the AI for `count` extra usernames not already in `exclude`.
+        Used only when too few rule-based candidates are available.
+        """
+        english_name = await self.name_service.aget_english_name(input_name)
+        ai_usernames = await self._generate_ai_usernames(english_name, count)
+        
+        seen = set(exclude)
+        extra_usernames = []
+        for username in ai_usernames:
+            if username not in seen:
+                seen.add(username)
+                extra_usernames.append(username)
+        return extra_usernames[:count]
+    
+    async def aclose(self) -> None:
+        """Stop the AI request batcher."""
+        await self._ai_batcher.aclose()
+    
+    async def _generate_ai_usernames(self, name: str, count: int = 6) -> List[str]:
         """Generate creative usernames using AI."""
         try:
-            prompt = f"""
-            Generate 6 creative and unique usernames based on the name "{name}".
+            # Concurrent requests are coalesced into one completion call
+            ai_usernames = await self._ai_batcher.submit((name, count))
+            if ai_usernames:
+                return ai_usernames
+            raise ValueError(f"no usernames returned for '{name}'")
+            
+        except Exception as e:
+            print(f"AI generation failed: {e}")
+            # Fallback to creative generation
+            return self._generate_creative_usernames(name)
+    
+    async def _generate_ai_usernames_batch(
+            self,
+            requests: List[Tuple[str, int]]
+    ) -> Dict[Tuple[str, int], List[str]]:
+        """Generate creative usernames for several (name, count) requests with a single AI call."""
+        names_text = '\n'.join([
+            f"Group {i+1}: {name} ({count} usernames)" for i, (name, count) in enumerate(requests)
+        ])
+        
+        prompt = f"""
+            Generate creative and unique usernames for each of the names below,
+            as many as requested for that name.
             
             Requirements:
             - Each username should be 4-20 characters long
@@ -70,124 +140,130 @@ class CreatorAgent:
             
             Examples of good usernames: john_dev, sarah_codes, mike_pro, anna_x, dev_alex
             
-            Return only the usernames, one per line, no extra text or numbering.
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4.1-nano",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=200,
-                temperature=0.8
-            )
+            Names:
+            {names_text}
             
+            Respond with a JSON object mapping each group number to its list of usernames,
+            for example: {{"groups": {{"1": ["john_dev", "sarah_codes"], "2": ["mike_pro"]}}}}
+            """
+        
+        response = await self.client.chat.completions.create(
+            model="gpt-4.1-nano",
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=sum(30 * count for _, count in requests) + 20 * len(requests),
+            temperature=0.8,
+            response_format={"type": "json_object"}
+        )
+        
+        payload = json.loads(response.choices[0].message.content)
+        groups = payload.get("groups") if isinstance(payload, dict) else None
+        if not isinstance(groups, dict):
+            groups = {}
+        
+        results = {}
+        for i, request in enumerate(requests):
             ai_usernames = []
-            content = response.choices[0].message.content.strip()
-            
-            for line in content.split('\n'):
-                username = line.strip()
+            group = groups.get(str(i + 1))
+            # A malformed group only costs its own request, not the whole batch
+            if not isinstance(group, list):
+                group = []
+            for username in group:
                 # Clean and validate username
-                username = re.sub(r'[^a-zA-Z0-9_]', '', username)
-                if 4 <= len(username) <= 20 and username:
+                username = _CLEAN_RE.sub('', str(username))
+                if 4 <= len(username) <= 20:
                     ai_usernames.append(username.lower())
-            
-            return ai_usernames[:6]
-            
-        except Exception as e:
-            print(f"AI generation failed: {e}")
-            # Fallback to creative generation
-            return self._generate_creative_usernames(name)
+            results[request] = ai_usernames[:request[1]]
+        
+        return results
     
     def _generate_rule_based_usernames(self, name: str) -> List[str]:
         """Generate usernames using traditional rules."""
-        usernames = []
+        # Lowercased, space-free base shared by the rules
+        clean = name.translate(_STRIP_SPACE).lower()
         
         # Apply first 5 rules
-        for rule in self.rules[:5]:
-            try:
-                username = rule(name)
-                if username and len(username) >= 3:
-                    usernames.append(username)
-            except Exception:
-                continue
-        
-        return usernames
+        return [u for u in (rule(name, clean) for rule in self.rules[:5]) if u and len(u) >= 3]
+    
+    def _next_draw(self) -> float:
+        """Pop a uniform [0, 1) draw, refilling the buffer in one vectorized call."""
+        if not self._draws:
+            self._draws = self._rng.random(RANDOM_BATCH).tolist()
+        return self._draws.pop()
+    
+    def _randint(self, low: int, high: int) -> int:
+        """Random integer in [low, high], like random.randint."""
+        return low + int(self._next_draw() * (high - low + 1))
+    
+    def _choice(self, options):
+        """Random element of a sequence, like random.choice."""
+        return options[int(self._next_draw() * len(options))]
     
-    def _add_underscore(self, name: str) -> str:
+    def _add_underscore(self, name: str, clean: str) -> str:
         """Add underscore between names or at the end."""
-        clean_name = name.replace(' ', '_').lower()
-        return clean_name
+        return name.translate(_LOWER_UNDERSCORE).lower()
     
-    def _add_numbers(self, name: str) -> str:
+    def _add_numbers(self, name: str, clean: str) -> str:
         """Add random numbers to the name."""
-        clean_name = name.replace(' ', '').lower()
-        return f"{clean_name}{random.randint(1, 999)}"
+        return f"{clean}{self._randint(1, 999)}"
     
-    def _add_year(self, name: str) -> str:
+    def _add_year(self, name: str, clean: str) -> str:
         """Add a year to the name."""
-        clean_name = name.replace(' ', '').lower()
-        year = random.choice([2020, 2021, 2022, 2023, 2024])
-        return f"{clean_name}{year}"
+        year = self._choice(self._YEARS)
+        return f"{clean}{year}"
     
-    def _add_dots(self, name: str) -> str:
+    def _add_dots(self, name: str, clean: str) -> str:
         """Add dots between names."""
-        return name.replace(' ', '.').lower()
+        return name.translate(_LOWER_DOT).lower()
     
-    def _add_prefix(self, name: str) -> str:
+    def _add_prefix(self, name: str, clean: str) -> str:
         """Add common prefixes."""
-        clean_name = name.replace(' ', '').lower()
-        prefixes = ['the', 'mr', 'ms', 'dr', 'prof']
-        prefix = random.choice(prefixes)
-        return f"{prefix}_{clean_name}"
+        prefix = self._choice(self._PREFIXES)
+        return f"{prefix}_{clean}"
     
-    def _add_suffix(self, name: str) -> str:
+    def _add_suffix(self, name: str, clean: str) -> str:
         """Add common suffixes."""
-        clean_name = name.replace(' ', '').lower()
-        suffixes = ['_official', '_real', '_pro', '_user', '_dev']
-        suffix = random.choice(suffixes)
-        return f"{clean_name}{suffix}"
+        suffix = self._choice(self._SUFFIXES)
+        return f"{clean}{suffix}"
     
-    def _make_lowercase(self, name: str) -> str:
+    def _make_lowercase(self, name: str, clean: str) -> str:
         """Simple lowercase version."""
-        return name.replace(' ', '').lower()
+        return clean
     
-    def _remove_spaces(self, name: str) -> str:
+    def _remove_spaces(self, name: str, clean: str) -> str:
         """Remove spaces and special characters."""
-        return re.sub(r'[^a-zA-Z0-9]', '', name).lower()
+        return name.translate(_KEEP_ALNUM).lower()
     
-    def _add_random_suffix(self, name: str) -> str:
+    def _add_random_suffix(self, name: str, clean: str) -> str:
         """Add random suffix."""
-        clean_name = name.replace(' ', '').lower()
-        suffixes = ['x', 'z', 'pro', '007', 'tech', 'dev']
-        suffix = random.choice(suffixes)
-        return f"{clean_name}_{suffix}"
+        suffix = self._choice(self._X_SUFFIXES)
+        return f"{clean}_{suffix}"
     
     def _generate_creative_usernames(self, name: str) -> List[str]:
         """Generate creative username variations."""
-        base_name = name.replace(' ', '').lower()
+        base_name = name.translate(_STRIP_SPACE).lower()
         creative = []
         
         # Reverse name
         creative.append(base_name[::-1])
         
         # Mix with common words
-        words = ['cool', 'super', 'mega', 'ultra', 'prime']
-        creative.append(f"{random.choice(words)}_{base_name}")
+        creative.append(f"{self._choice(self._CREATIVE_WORDS)}_{base_name}")
         
         # First letter + numbers
         if base_name:
-            creative.append(f"{base_name[0]}{base_name}{random.randint(10, 99)}")
+            creative.append(f"{base_name[0]}{base_name}{self._randint(10, 99)}")
         
         # Add 'x' variations
-        creative.append(f"{base_name}x{random.randint(1, 9)}")
+        creative.append(f"{base_name}x{self._randint(1, 9)}")
         
         return creative[:4]
     
     def _create_variation(self, base_name: str) -> str:
         """Create a simple variation of the base name."""
         variations = [
-            f"{base_name}{random.randint(100, 999)}",
-            f"{base_name}_v{random.randint(1, 9)}",
+            f"{base_name}{self._randint(100, 999)}",
+            f"{base_name}_v{self._randint(1, 9)}",
             f"user_{base_name}",
             f"{base_name}_new"
         ]
-        return random.choice(variations)
+        return self._choice(variations)
@@ -1,50 +1,69 @@
 
 import os
-from typing import List, Tuple
-import re
-from openai import OpenAI
+import json
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+import httpx
+from openai import AsyncOpenAI
+from cachetools import TTLCache
 from src.services.database_service import DatabaseService
+from src.services.batch_service import MicroBatcher
+
+SCORE_CACHE_MAXSIZE = 4096
+SCORE_CACHE_TTL = 3600  # seconds
 
 class ReviewerAgent:
     """AI-powered agent responsible for reviewing and ranking username candidates."""
     
-    def __init__(self, db_service: DatabaseService):
+    def __init__(self, db_service: DatabaseService, http_client: Optional[httpx.AsyncClient] = None):
         self.db_service = db_service
-        self.client = OpenAI(base_url = os.getenv("OPENAI_BASE_URL"))
+        self.client = AsyncOpenAI(base_url = os.getenv("OPENAI_BASE_URL"), http_client = http_client)
+        self._ai_batcher = MicroBatcher(self._get_ai_ranking_batch)
+        self._score_cache = TTLCache(maxsize=SCORE_CACHE_MAXSIZE, ttl=SCORE_CACHE_TTL)
     
-    def review_and_rank(self, input_name: str, usernames: List[str]) -> List[str]:
+    async def review_and_rank(self, input_name: str, usernames: List[str]) -> List[str]:
         """
         Review usernames, filter out existing ones, and return top 3.
         """
         # Filter out existing usernames
-        available_usernames = self._filter_existing_usernames(usernames)
-        
+        available_usernames = await self.filter_available_usernames(usernames)
+        return await self.rank_usernames(input_name, available_usernames)
+    
+    async def filter_available_usernames(self, usernames: List[str]) -> List[str]:
+        """Filter out usernames that already exist in the database."""
+        return await self.db_service.afilter_available(usernames)
+    
+    async def rank_usernames(self, input_name: str, available_usernames: List[str]) -> List[str]:
+        """
+        Rank already-filtered usernames and return top 3.
+        """
         if not available_usernames:
             return []
         
+        # With 3 or fewer left, all are returned anyway; skip the AI call
+        if len(available_usernames) <= 3:
+            return self._rank_usernames_traditional(available_usernames)
+        
         # Use AI to enhance ranking, combined with rule-based scoring
-        ranked_usernames = self._ai_enhanced_ranking(input_name, available_usernames)
+        ranked_usernames = await self._ai_enhanced_ranking(input_name, available_usernames)
         
         # Return top 3
         return ranked_usernames[:3]
     
-    def _filter_existing_usernames(self, usernames: List[str]) -> List[str]:
-        """Filter out usernames that already exist in the database."""
-        existing_usernames = self.db_service.check_multiple_usernames(usernames)
-        return [u for u in usernames if u.lower() not in existing_usernames]
+    async def aclose(self) -> None:
+        """Stop the AI request batcher."""
+        await self._ai_batcher.aclose()
     
-    def _ai_enhanced_ranking(self, input_name: str, usernames: List[str]) -> List[str]:
+    async def _ai_enhanced_ranking(self, input_name: str, usernames: List[str]) -> List[str]:
         """
         Use AI to enhance ranking combined with traditional scoring.
         """
         try:
             # Get AI evaluation
-            ai_rankings = self._get_ai_ranking(input_name, usernames)
+            ai_rankings = await self._get_ai_ranking(input_name, usernames)
             
             # Get traditional scoring
-            traditional_scores = {}
-            for username in usernames:
-                traditional_scores[username] = self._calculate_traditional_score(username)
+            traditional_scores = dict(zip(usernames, self._calculate_traditional_scores(usernames)))
             
             # Combine AI and traditional scoring
             combined_scores = {}
@@ -57,7 +76,7 @@ class ReviewerAgent:
                 combined_scores[username] = combined_score
             
             # Sort by combined score
-            sorted_usernames = sorted(combined_scores.items(), key=lambda x: x[1], reverse=True)
+            sorted_usernames = sorted(combined_scores.items(), key=itemgetter(1), reverse=True)
             return [username for username, _ in sorted_usernames]
             
         except Exception as e:
@@ -65,13 +84,37 @@ class ReviewerAgent:
             # Fallback to traditional ranking
             return self._rank_usernames_traditional(usernames)
     
-    def _get_ai_ranking(self, input_name: str, usernames: List[str]) -> dict:
+    async def _get_ai_ranking(self, input_name: str, usernames: List[str]) -> dict:
         """Get AI-based ranking of usernames."""
         try:
-            usernames_text = '\n'.join([f"{i+1}. {username}" for i, username in enumerate(usernames)])
+            cache_key = (input_name.lower().strip(), tuple(usernames))
+            if cache_key in self._score_cache:
+                return self._score_cache[cache_key]
             
-            prompt = f"""
-            Evaluate and score these usernames for a given input name from 0-100 based on:
+            # Concurrent requests are coalesced into one completion call
+            ai_scores = await self._ai_batcher.submit((input_name, tuple(usernames)))
+            if ai_scores:
+                self._score_cache[cache_key] = ai_scores
+            return ai_scores or {}
+            
+        except Exception as e:
+            print(f"AI scoring failed: {e}")
+            return {}
+    
+    async def _get_ai_ranking_batch(
+            self,
+            requests: List[Tuple[str, Tuple[str, ...]]]
+    ) -> Dict[Tuple[str, Tuple[str, ...]], dict]:
+        """Get AI-based ranking for several (input_name, usernames) pairs in one call."""
+        groups_text = '\n\n'.join([
+            f"Group {i+1}:\n"
+            f"Input name: {input_name}\n"
+            f"Usernames to evaluate:\n" + '\n'.join([f"{j+1}. {username}" for j, username in enumerate(usernames)])
+            for i, (input_name, usernames) in enumerate(requests)
+        ])
+        
+        prompt = f"""
+            Evaluate and score the usernames in each group for the group's input name from 0-100 based on:
             - Memorability and ease of remembering
             - Professional appearance
             - Ease of typing and pronunciation
@@ -79,59 +122,54 @@ class ReviewerAgent:
             - Overall appeal for social media/professional use
             - Alignment with the input name of the user 
             
-            Input name: {input_name}
-            Usernames to evaluate: {usernames_text}
+            {groups_text}
             
-            Respond with ONLY the scores in this exact format:
-            username1: score
-            username2: score
-            ...
-            
-            Example format:
-            john_dev: 85
-            sarah_codes: 92
+            Respond with a JSON object mapping each group number to its usernames' scores,
+            for example: {{"groups": {{"1": {{"john_dev": 85, "sarah_codes": 92}}}}}}
             """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4.1-nano",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=300,
-                temperature=0.3
-            )
-            
-            # Parse AI response
+        
+        response = await self.client.chat.completions.create(
+            model="gpt-4.1-nano",
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=300 * len(requests),
+            temperature=0.3,
+            response_format={"type": "json_object"}
+        )
+        
+        # Parse AI response
+        payload = json.loads(response.choices[0].message.content)
+        groups = payload.get("groups") if isinstance(payload, dict) else None
+        if not isinstance(groups, dict):
+            groups = {}
+        
+        results = {}
+        for i, request in enumerate(requests):
             ai_scores = {}
-            content = response.choices[0].message.content.strip()
-            
-            for line in content.split('\n'):
-                if ':' in line:
-                    try:
-                        username, score_str = line.split(':', 1)
-                        username = username.strip()
-                        score = int(score_str.strip())
-                        ai_scores[username] = min(100, max(0, score))  # Clamp between 0-100
-                    except (ValueError, IndexError):
-                        continue
-            
-            return ai_scores
-            
-        except Exception as e:
-            print(f"AI scoring failed: {e}")
-            return {}
+            group = groups.get(str(i + 1))
+            # A malformed group only costs its own request, not the whole batch
+            if not isinstance(group, dict):
+                group = {}
+            for username, score in group.items():
+                if isinstance(score, (int, float)):
+                    ai_scores[username.lower()] = min(100, max(0, int(score)))  # Clamp between 0-100
+            results[request] = ai_scores
+        
+        return results
     
     def _rank_usernames_traditional(self, usernames: List[str]) -> List[str]:
         """Traditional ranking method as fallback."""
-        scored_usernames = []
-        
-        for username in usernames:
-            score = self._calculate_traditional_score(username)
-            scored_usernames.append((username, score))
+        scored_usernames = list(zip(usernames, self._calculate_traditional_scores(usernames)))
         
         # Sort by score (descending)
-        scored_usernames.sort(key=lambda x: x[1], reverse=True)
+        scored_usernames.sort(key=itemgetter(1), reverse=True)
         
         return [username for username, _ in scored_usernames]
     
+    def _calculate_traditional_scores(self, usernames: List[str]) -> List[int]:
+        """Calculate traditional scores for a whole candidate list."""
+        score = self._calculate_traditional_score
+        return [score(username) for username in usernames]
+    
     def _calculate_traditional_score(self, username: str) -> int:
         """
         Calculate a traditional quality score for a username.
@@ -149,14 +187,15 @@ class ReviewerAgent:
             score -= 10
         
         # Avoid too many numbers
-        number_count = len(re.findall(r'\d', username))
+        number_count = sum(1 for c in username if c.isdigit())
         if number_count <= 2:
             score += 10
         else:
             score -= 5
         
-        # Prefer readable patterns
-        if re.match(r'^[a-zA-Z][a-zA-Z0-9_]*', username):
+        # Prefer readable patterns (starts with an ASCII letter)
+        first_char = username[:1]
+        if first_char.isascii() and first_char.isalpha():
             score += 5
         else:
             score -= 5
@@ -5,6 +5,7 @@ if loaded:
 else:
     print(".env not found")
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import List
@@ -15,15 +16,22 @@ from src.graph.workflow import UsernameWorkflow
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Initialize the workflow
+workflow = UsernameWorkflow()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release the workflow's batchers, HTTP connections and DB workers on shutdown."""
+    yield
+    await workflow.aclose()
+
 app = FastAPI(
     title="Username Recommendation System",
     description="Multi-agent system for generating username recommendations",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Initialize the workflow
-workflow = UsernameWorkflow()
-
 class UsernameRequest(BaseModel):
     """Request model for username generation."""
     name: str
@@ -63,7 +71,7 @@ async def generate_usernames(request: UsernameRequest):
         logger.info(f"Generating usernames for: {request.name}")
         
         # Generate usernames using the workflow
-        recommended_usernames = workflow.generate_usernames(request.name.strip())
+        recommended_usernames = await workflow.generate_usernames(request.name.strip())
         
         logger.info(f"Generated {len(recommended_usernames)} usernames")
         
@@ -2,18 +2,28 @@
 from typing import Dict, Any, List
 from langgraph.graph import StateGraph, END
 from pydantic import BaseModel
+from cachetools import TTLCache
+import httpx
 from src.agents.creator import CreatorAgent
 from src.agents.reviewer import ReviewerAgent
 from src.services.name_service import NameService
 from src.services.database_service import DatabaseService
 import os
 
+CACHE_MAXSIZE = 4096
+CACHE_TTL = 3600  # seconds
+MIN_AVAILABLE = 3
+HTTP_TIMEOUT = 30  # seconds
+
 class UsernameState(BaseModel):
     """State model for the username recommendation workflow."""
     input_name: str
     candidate_usernames: List[str] = []
+    available_usernames: List[str] = []
     final_usernames: List[str] = []
     error: str = ""
+    attempts: int = 0
+    augmented: bool = False
 
 class UsernameWorkflow:
     """LangGraph workflow for username recommendation."""
@@ -26,8 +36,17 @@ class UsernameWorkflow:
             password=os.environ["DB_PASSWORD"],
             database=os.environ["DB_NAME"]
         )
-        self.creator_agent = CreatorAgent(self.name_service)
-        self.reviewer_agent = ReviewerAgent(self.db_service)
+        # One keep-alive HTTP/2 pool shared by both agents' OpenAI clients
+        self._http = httpx.AsyncClient(
+            http2=True,
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_keepalive_connections=100, max_connections=200)
+        )
+        self.creator_agent = CreatorAgent(self.name_service, http_client=self._http)
+        self.reviewer_agent = ReviewerAgent(self.db_service, http_client=self._http)
+        # Creator candidates per normalized input name; availability is
+        # still checked by the reviewer on every request
+        self._candidate_cache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL)
         
         # Build the graph
         self.graph: StateGraph = self._build_graph()
@@ -39,10 +58,21 @@ class UsernameWorkflow:
         
         # Add nodes
         graph.add_node("creator", self._creator_node)
+        graph.add_node("filter", self._filter_node)
+        graph.add_node("augment", self._augment_node)
         graph.add_node("reviewer", self._reviewer_node)
         
         # Add edges
-        graph.add_edge("creator", "reviewer")        
+        graph.add_edge("creator", "filter")
+        def filter_condition(state: UsernameState) -> str:
+            if state.error:
+                return "reviewer"
+            # Only fall back to the LLM when the rule-based set runs short
+            if len(state.available_usernames) < MIN_AVAILABLE and not state.augmented:
+                return "augment"
+            return "reviewer"
+        graph.add_conditional_edges("filter", filter_condition)
+        graph.add_edge("augment", "filter")
         def reviewer_condition(state: UsernameState) -> str:
             if state.error:
                 return END
@@ -57,30 +87,73 @@ class UsernameWorkflow:
         
         return graph.compile()
     
-    def _creator_node(self, state: UsernameState) -> Dict[str, Any]:
+    async def _creator_node(self, state: UsernameState) -> Dict[str, Any]:
         """Creator agent node."""
         try:
-            candidate_usernames = self.creator_agent.create_usernames(state.input_name)
-            return {"candidate_usernames": candidate_usernames}
+            cache_key = state.input_name.lower().strip()
+            # Only the first pass may reuse cached candidates; retries need fresh ones
+            if state.attempts == 0 and cache_key in self._candidate_cache:
+                candidate_usernames = self._candidate_cache[cache_key]
+            else:
+                candidate_usernames = await self.creator_agent.create_usernames(state.input_name)
+                self._candidate_cache[cache_key] = candidate_usernames
+            return {
+                "candidate_usernames": candidate_usernames,
+                "attempts": state.attempts + 1,
+                "augmented": False
+            }
         except Exception as e:
             return {"error": f"Creator error: {str(e)}"}
     
-    def _reviewer_node(self, state: UsernameState) -> Dict[str, Any]:
+    async def _filter_node(self, state: UsernameState) -> Dict[str, Any]:
+        """Availability filter node."""
+        try:
+            if state.error:
+                return {"available_usernames": []}
+            
+            available_usernames = await self.reviewer_agent.filter_available_usernames(
+                state.candidate_usernames
+            )
+            return {"available_usernames": available_usernames}
+        except Exception as e:
+            return {"error": f"Filter error: {str(e)}"}
+    
+    async def _augment_node(self, state: UsernameState) -> Dict[str, Any]:
+        """LLM augment node, requesting only the shortfall of available usernames."""
+        try:
+            shortfall = MIN_AVAILABLE - len(state.available_usernames)
+            extra_usernames = await self.creator_agent.augment_usernames(
+                state.input_name, shortfall, exclude=state.candidate_usernames
+            )
+            candidate_usernames = state.candidate_usernames + extra_usernames
+            self._candidate_cache[state.input_name.lower().strip()] = candidate_usernames
+            return {"candidate_usernames": candidate_usernames, "augmented": True}
+        except Exception as e:
+            return {"error": f"Augment error: {str(e)}"}
+    
+    async def _reviewer_node(self, state: UsernameState) -> Dict[str, Any]:
         """Reviewer agent node."""
         try:
             if state.error:
                 return {"final_usernames": []}
             
-            final_usernames = self.reviewer_agent.review_and_rank(state.input_name, state.candidate_usernames)
+            final_usernames = await self.reviewer_agent.rank_usernames(state.input_name, state.available_usernames)
             return {"final_usernames": final_usernames}
         except Exception as e:
             return {"error": f"Reviewer error: {str(e)}"}
     
-    def generate_usernames(self, input_name: str) -> List[str]:
+    async def generate_usernames(self, input_name: str) -> List[str]:
         """
         Generate username recommendations for the given input name.
         """
         initial_state = UsernameState(input_name=input_name)
-        result = self.graph.invoke(initial_state)
+        result = await self.graph.ainvoke(initial_state)
         
         return result['final_usernames']
+    
+    async def aclose(self) -> None:
+        """Stop the agents' batchers, the database executor and the shared HTTP pool."""
+        await self.creator_agent.aclose()
+        await self.reviewer_agent.aclose()
+        await self._http.aclose()
+        self.db_service.close()
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_SIZE = 8
+BATCH_MAX_WAIT = 0.05  # seconds
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent requests into a single batched call.
+
+    Callers ``submit`` a hashable key and await its result. A background task
+    collects keys for up to ``max_wait`` seconds (or until ``max_batch_size``
+    keys are queued), hands the unique keys to ``handler`` in one call and
+    resolves every waiting future from the returned mapping. Each batch runs
+    in its own task, so several batches can be in flight at once.
+    """
+
+    def __init__(
+            self,
+            handler: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+            max_batch_size: int = BATCH_MAX_SIZE,
+            max_wait: float = BATCH_MAX_WAIT
+    ) -> None:
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+
+    async def submit(self, key: Hashable) -> Any:
+        """
+        Queue a key for the next batch and wait for its result.
+
+        :param key: Hashable request key passed to the handler.
+        :return: The handler's result for this key.
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((key, future))
+        return await future
+
+    def _ensure_worker(self) -> None:
+        """Start the background batching task on the running loop."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def _collect(self) -> List[Tuple[Hashable, asyncio.Future]]:
+        """Wait for one item, then gather more until the window closes."""
+        items = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(items) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def _run(self) -> None:
+        """Batching loop: keep collecting while earlier batches are still in flight."""
+        while True:
+            items = await self._collect()
+
+            # Group waiters by key so duplicate requests share one slot
+            waiters: Dict[Hashable, List[asyncio.Future]] = {}
+            for key, future in items:
+                waiters.setdefault(key, []).append(future)
+
+            task = asyncio.get_running_loop().create_task(self._dispatch(waiters))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, waiters: Dict[Hashable, List[asyncio.Future]]) -> None:
+        """Run one batch through the handler and resolve its waiters."""
+        try:
+            results = await self.handler(list(waiters))
+        except asyncio.CancelledError:
+            for futures in waiters.values():
+                for future in futures:
+                    future.cancel()
+            raise
+        except Exception as e:
+            logger.warning(f"Batched call failed for {len(waiters)} keys: {e}")
+            for futures in waiters.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        for key, futures in waiters.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(results.get(key))
+
+    async def aclose(self) -> None:
+        """Cancel the batching loop and any batches still in flight."""
+        tasks = list(self._in_flight)
+        if self._worker is not None:
+            tasks.append(self._worker)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._worker = None
+        if self._queue is not None:
+            # Waiters queued for a batch that will never be dispatched
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                future.cancel()
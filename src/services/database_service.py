@@ -1,7 +1,16 @@
+import asyncio
 import mysql.connector
 from mysql.connector import Error
+from mysql.connector.pooling import MySQLConnectionPool
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import List, Set
+import threading
+import time
+from typing import List, Optional, Set
+
+POOL_NAME = "usernames_pool"
+POOL_SIZE = 16
+CACHE_TTL = 30  # seconds; bounds how long a username registered elsewhere can look available
 
 
 class DatabaseService:
@@ -13,25 +22,48 @@ class DatabaseService:
         user: str = "root",
         password: str = "",
         database: str = "usernames_db",
+        pool_size: int = POOL_SIZE,
+        cache_ttl: float = CACHE_TTL,
     ):
         self.host = host
         self.user = user
         self.password = password
         self.database = database
+        self.pool_size = pool_size
+        self.cache_ttl = cache_ttl
+        self._pool: Optional[MySQLConnectionPool] = None
+        self._cache: Set[str] = set()
+        # Other writers share the table, so the set is only trusted while it is fresh;
+        # a missing or stale set must not be read as "nothing is taken"
+        self._cache_loaded_at: Optional[float] = None
+        self._cache_lock = threading.Lock()
+        # get_connection() raises instead of waiting when the pool is empty, so async
+        # callers get one worker per pooled connection rather than the shared default executor
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="db")
         self._initialize_db()
+        self.refresh_cache()
+
+    def _get_pool(self) -> MySQLConnectionPool:
+        """Create the connection pool on first use (the database must exist)."""
+        if self._pool is None:
+            self._pool = MySQLConnectionPool(
+                pool_name=POOL_NAME,
+                pool_size=self.pool_size,
+                host=self.host,
+                user=self.user,
+                password=self.password,
+                database=self.database,
+            )
+        return self._pool
 
     @contextmanager
     def _get_connection(self):
-        """Context manager for database connections."""
-        conn = mysql.connector.connect(
-            host=self.host,
-            user=self.user,
-            password=self.password,
-            database=self.database,
-        )
+        """Context manager for pooled database connections."""
+        conn = self._get_pool().get_connection()
         try:
             yield conn
         finally:
+            # Returns the connection to the pool
             conn.close()
 
     def _initialize_db(self):
@@ -85,29 +117,99 @@ class DatabaseService:
         except Error as e:
             print(f"Database initialization error: {e}")
 
-    def check_username_exists(self, username: str) -> bool:
-        """Check if a username already exists in the database."""
+    def refresh_cache(self):
+        """Reload the in-memory set of known usernames from the database."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT username FROM usernames")
+                self._cache = {row[0] for row in cursor.fetchall()}
+            self._cache_loaded_at = time.monotonic()
+        except Error as e:
+            print(f"Username cache load error: {e}")
+
+    def _cache_fresh(self) -> bool:
+        """Whether the set was loaded within the last cache_ttl seconds."""
+        loaded_at = self._cache_loaded_at
+        return loaded_at is not None and time.monotonic() - loaded_at < self.cache_ttl
+
+    def _cache_ready(self) -> bool:
+        """Reload a missing or expired cache; callers query the database directly if that fails."""
+        if not self._cache_fresh():
+            with self._cache_lock:
+                # Another thread may have reloaded it while we waited
+                if not self._cache_fresh():
+                    self.refresh_cache()
+        return self._cache_fresh()
+
+    def _confirm_existing(self, usernames: List[str]) -> Set[str]:
+        """Confirm cached hits against the database, dropping stale entries."""
         with self._get_connection() as conn:
             cursor = conn.cursor()
+            placeholders = ",".join(["%s"] * len(usernames))
             cursor.execute(
-                "SELECT 1 FROM usernames WHERE username = %s LIMIT 1",
-                (username.lower(),),
+                f"SELECT username FROM usernames WHERE username IN ({placeholders})",
+                usernames,
             )
-            return cursor.fetchone() is not None
+            existing = {row[0] for row in cursor.fetchall()}
+        self._cache.difference_update(set(usernames) - existing)
+        return existing
+
+    def check_username_exists(self, username: str) -> bool:
+        """Check if a username already exists in the database."""
+        return bool(self.check_multiple_usernames([username]))
 
     def check_multiple_usernames(self, usernames: List[str]) -> Set[str]:
         """Check multiple usernames and return set of existing ones."""
         if not usernames:
             return set()
 
+        lowered = {u.lower() for u in usernames}
+        if not self._cache_ready():
+            return self._confirm_existing(list(lowered))
+
+        # Misses are answered from memory; only cached hits go to the database
+        hits = list(lowered & self._cache)
+        if not hits:
+            return set()
+        return self._confirm_existing(hits)
+
+    def filter_available(self, usernames: List[str]) -> List[str]:
+        """Return the lowercased usernames that do not exist, in input order."""
+        candidates = [u.lower() for u in usernames]
+        if not candidates:
+            return candidates
+        if self._cache_ready() and not self._cache.intersection(candidates):
+            return candidates
+
+        # One round-trip: the database does the set difference
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            placeholders = ",".join(["%s"] * len(usernames))
+            rows = " UNION ALL ".join(["SELECT %s AS pos, %s AS username"] * len(candidates))
+            params = [value for pos, u in enumerate(candidates) for value in (pos, u)]
             cursor.execute(
-                f"SELECT username FROM usernames WHERE username IN ({placeholders})",
-                [u.lower() for u in usernames],
+                f"""
+                SELECT c.username FROM ({rows}) AS c
+                WHERE c.username NOT IN (SELECT username FROM usernames)
+                ORDER BY c.pos
+                """,
+                params,
             )
-            return {row[0] for row in cursor.fetchall()}
+            available = [row[0] for row in cursor.fetchall()]
+        self._cache.difference_update(available)
+        return available
+
+    async def afilter_available(self, usernames: List[str]) -> List[str]:
+        """
+        Async variant of filter_available.
+        Runs the query on the database executor so it does not block the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.filter_available, usernames)
+
+    def close(self):
+        """Stop the database executor's worker threads."""
+        self._executor.shutdown(wait=False)
 
     def add_username(self, username: str):
         """Add a username to the database."""
@@ -118,3 +220,4 @@ class DatabaseService:
                 (username.lower(),),
             )
             conn.commit()
+        self._cache.add(username.lower())
@@ -1,14 +1,32 @@
+import asyncio
 import re
+import threading
 from typing import Optional
+import numpy as np
 import pandas as pd
-from functools import lru_cache
+import pyarrow.csv as pacsv
+from functools import cache
+from cachetools import LRUCache
+from rapidfuzz import process
+from rapidfuzz.utils import default_process
 from rapidfuzz.distance import Levenshtein, JaroWinkler, DamerauLevenshtein
-from typing import List, Tuple, Optional
+from typing import Callable, Dict, List, Tuple, Optional
 import logging 
 
+logger = logging.getLogger(__name__)
+
 TOP_K = 3
+MATCH_CACHE_SIZE = 1024
+# Below this many rows one flat cdist beats the pruned search's per-bucket overhead
+PRUNED_SEARCH_MIN_ROWS = 8000
 LOG_ENABLED = True
 NATIVE_LANG = 'fa'
+LANG_COLUMNS = {NATIVE_LANG: 'name', 'en': 'english_name'}
+
+def _trigrams(name: str) -> set:
+    """Distinct 3-character substrings of a name."""
+    return {name[i:i + 3] for i in range(len(name) - 2)}
+
 
 class DataManager:
     """
@@ -17,28 +35,200 @@ class DataManager:
     def __init__(self, names_file: str) -> None:
         self.names_file = names_file
 
-        self.names_df = pd.read_csv(self.names_file)
+        # Arrow-backed string columns live in contiguous buffers, not one PyObject per cell
+        self.names_df = pacsv.read_csv(self.names_file).to_pandas(types_mapper=pd.ArrowDtype)
+        # Materialized once; rapidfuzz and plain iteration read a list[str] without pandas boxing
+        self._names_list = {
+            column: self.names_df[column].tolist()
+            for column in ('name', 'english_name')
+        }
+        # Object arrays over the same str objects, for fancy-indexing the top-k rows
+        self._name_arrays = {
+            column: np.array(names, dtype=object)
+            for column, names in self._names_list.items()
+        }
+        # Normalized once at load so queries only pay for their own preprocessing
+        self._processed_names = {
+            column: [default_process(name) for name in names]
+            for column, names in self._names_list.items()
+        }
+        self._length_buckets = {
+            column: self._bucket_by_length(names)
+            for column, names in self._processed_names.items()
+        }
+        # First row per preprocessed name; the full scan also breaks ties on row order
+        self._exact_index = {
+            column: {name: idx for idx, name in reversed(list(enumerate(names)))}
+            for column, names in self._processed_names.items()
+        }
+        self._trigram_index = {
+            column: self._index_trigrams(names)
+            for column, names in self._processed_names.items()
+        }
+        self._bucket_positions = {
+            column: self._locate_in_buckets(buckets, len(self._processed_names[column]))
+            for column, buckets in self._length_buckets.items()
+        }
+
+    @staticmethod
+    def _bucket_by_length(names: List[str]) -> Dict[int, Tuple[List[str], np.ndarray]]:
+        """Group names by length, keeping their original row indices."""
+        buckets: Dict[int, List[int]] = {}
+        for idx, name in enumerate(names):
+            buckets.setdefault(len(name), []).append(idx)
+        return {
+            length: ([names[idx] for idx in indices], np.array(indices, dtype=np.intp))
+            for length, indices in buckets.items()
+        }
+
+    @staticmethod
+    def _index_trigrams(names: List[str]) -> Dict[str, np.ndarray]:
+        """Map every trigram to the sorted row indices of the names containing it."""
+        postings: Dict[str, List[int]] = {}
+        for idx, name in enumerate(names):
+            for gram in _trigrams(name):
+                postings.setdefault(gram, []).append(idx)
+        return {gram: np.array(rows, dtype=np.intp) for gram, rows in postings.items()}
+
+    @staticmethod
+    def _locate_in_buckets(
+            buckets: Dict[int, Tuple[List[str], np.ndarray]],
+            size: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Length bucket and position within that bucket for every row."""
+        lengths = np.empty(size, dtype=np.intp)
+        positions = np.empty(size, dtype=np.intp)
+        for length, (_, indices) in buckets.items():
+            lengths[indices] = length
+            positions[indices] = np.arange(len(indices))
+        return lengths, positions
 
-    def get_names(self, column: str) -> pd.Series:
+    def get_names(self, column: str) -> List[str]:
         """
         Get the names column from the names dataframe.
 
         :param column: Column name ('name' or 'english_name').
-        :return: Pandas Series of names.
+        :return: Cached list of names.
+        """
+        return self._names_list[column]
+
+    def get_name_array(self, column: str) -> np.ndarray:
+        """
+        Get the names column as a cached NumPy array.
+
+        :param column: Column name ('name' or 'english_name').
+        :return: NumPy object array of names.
+        """
+        return self._name_arrays[column]
+
+    def get_processed_names(self, column: str) -> List[str]:
+        """
+        Get the names column normalized with rapidfuzz's default_process.
+
+        :param column: Column name ('name' or 'english_name').
+        :return: List of lowercased, punctuation-free names.
+        """
+        return self._processed_names[column]
+
+    def get_length_buckets(self, column: str) -> Dict[int, Tuple[List[str], np.ndarray]]:
+        """
+        Get the preprocessed names of a column grouped by length.
+
+        :param column: Column name ('name' or 'english_name').
+        :return: Mapping of length to (names, original row indices).
+        """
+        return self._length_buckets[column]
+
+    def get_exact_index(self, column: str) -> Dict[str, int]:
+        """
+        Get the lookup from preprocessed name to its first row in a column.
+
+        :param column: Column name ('name' or 'english_name').
+        :return: Mapping of preprocessed name to row index.
+        """
+        return self._exact_index[column]
+
+    def get_trigram_index(self, column: str) -> Dict[str, np.ndarray]:
+        """
+        Get the trigram inverted index over the preprocessed names of a column.
+
+        :param column: Column name ('name' or 'english_name').
+        :return: Mapping of trigram to the row indices of the names containing it.
+        """
+        return self._trigram_index[column]
+
+    def get_bucket_positions(self, column: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get where each row of a column sits in its length bucket.
+
+        :param column: Column name ('name' or 'english_name').
+        :return: Arrays of (bucket length, position in bucket), indexed by row.
         """
-        return self.names_df[column]
+        return self._bucket_positions[column]
+
+
+def _top_k(scores: np.ndarray, indices: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Best k (score, index) pairs in O(N), sorted by score with ties broken by lower index.
+    """
+    k = min(k, len(scores))
+    if k == 0:
+        return scores[:0], indices[:0]
+    # argpartition finds the kth-best score; every row at or above it is a candidate
+    threshold = scores[np.argpartition(scores, -k)[-k]]
+    candidates = np.flatnonzero(scores >= threshold)
+    order = candidates[np.lexsort((indices[candidates], -scores[candidates]))][:k]
+    return scores[order], indices[order]
+
+
+@cache
+def get_data_manager(names_file: str) -> DataManager:
+    """
+    Get the DataManager for a names file, loading the CSV only once per process.
+
+    :param names_file: Path to the names CSV.
+    :return: Shared DataManager instance.
+    """
+    return DataManager(names_file)
+
 
 class NameMatcher:
     """
     Handles matching names using various similarity metrics.
     """
 
+    _SCORERS = {
+        'levenshtein': Levenshtein.normalized_similarity,
+        'damerau': DamerauLevenshtein.normalized_similarity,
+        'jaro_winkler': JaroWinkler.similarity,
+    }
+    # Edit-distance scorers, mapped to the most trigrams a single edit can destroy
+    # (a transposition touches two characters, so Damerau can lose one more)
+    _TRIGRAMS_PER_EDIT = {
+        Levenshtein.normalized_similarity: 3,
+        DamerauLevenshtein.normalized_similarity: 4,
+    }
+
     def __init__(self, data_manager: DataManager, top_k: int = TOP_K, debug: bool = LOG_ENABLED) -> None:
         self.data_manager = data_manager
         self.top_k = top_k
         self.debug = debug
+        # Plain, preprocessed lists let rapidfuzz run the whole 1xN comparison in C++
+        self._choices = {
+            column: data_manager.get_processed_names(column)
+            for column in ('name', 'english_name')
+        }
+        # Keyed on (preprocessed name, lang, method); guarded for aget_english_name's threads
+        self._cache = LRUCache(maxsize=MATCH_CACHE_SIZE)
+        self._cache_lock = threading.Lock()
+        self._warm_up()
+
+    def _warm_up(self) -> None:
+        """Run every scorer once so CPU-feature dispatch happens before the first request."""
+        for scorer in self._SCORERS.values():
+            scorer("a", "a")
+            process.cdist(["a"], ["a"], scorer=scorer, processor=None, dtype=np.float32)
 
-    @lru_cache(maxsize=1024)
     def get_top_matches(
             self,
             name: str,
@@ -53,89 +243,169 @@ class NameMatcher:
         :param method: The similarity method ('levenshtein', 'damerau', 'jaro_winkler').
         :return: List of tuples containing matched name, score, gender, and index.
         """
-        column = 'name' if lang == NATIVE_LANG else 'english_name'
-        if method == 'levenshtein':
-            return self._get_top_matches_levenshtein(name, column)
-        elif method == 'damerau':
-            return self._get_top_matches_damerau_levenshtein(name, column)
-        elif method == 'jaro_winkler':
-            return self._get_top_matches_jaro_winkler(name, column)
-        else:
-            raise ValueError(f"Unsupported method: {method}")
+        if lang not in LANG_COLUMNS:
+            raise ValueError(f"Unsupported lang: {lang}")
+        # "Ali", "ali " and " Ali" share one cache entry
+        key = (default_process(name), lang, method)
+        with self._cache_lock:
+            matches = self._cache.get(key)
+        if matches is None:
+            matches = self._get_top_matches_uncached(*key)
+            with self._cache_lock:
+                self._cache[key] = matches
+        return matches
+
+    def get_exact_match(self, name: str, lang: str) -> Optional[Tuple[str, float, str, int]]:
+        """
+        Look a name up verbatim (after preprocessing), without scoring the corpus.
+
+        :param name: The name to match.
+        :param lang: Language of the name ('en' or NATIVE_LANG).
+        :return: Tuple of matched name, score, english name, and index, or None.
+        """
+        column = LANG_COLUMNS[lang]
+        idx = self.data_manager.get_exact_index(column).get(default_process(name))
+        if idx is None:
+            return None
+        return (
+            self.data_manager.get_name_array(column)[idx],
+            100.0,
+            self.data_manager.get_name_array('english_name')[idx],
+            idx
+        )
 
-    def _get_top_matches_levenshtein(
+    def _get_top_matches_uncached(
             self,
-            name: str,
-            column: str
+            query: str,
+            lang: str,
+            method: str
     ) -> List[Tuple[str, float, str, int]]:
-        scores = self.data_manager.get_names(column).apply(
-            lambda x: Levenshtein.normalized_similarity(name, x) * 100
-        )
-        top_indices = scores.nlargest(self.top_k).index
-        matches = [
-            (
-                self.data_manager.names_df.at[idx, column],
-                scores.at[idx],
-                self.data_manager.names_df.at[idx, 'english_name'],
-                idx
-            )
-            for idx in top_indices
-        ]
-        if self.debug:
-            logging.info(f"[Levenshtein] Name: {name}, Matches: {matches}")
+        """Run a preprocessed query through the scorer registered for the method."""
+        scorer = self._SCORERS.get(method)
+        if scorer is None:
+            raise ValueError(f"Unsupported method: {method}")
+        matches = self._get_top_matches(query, LANG_COLUMNS[lang], scorer)
+        if self.debug and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[%s] Name: %s, Matches: %s", method, query, matches)
         return matches
 
-    def _get_top_matches_damerau_levenshtein(
+    def _get_top_matches(
             self,
             name: str,
-            column: str
+            column: str,
+            scorer: Callable[..., float]
     ) -> List[Tuple[str, float, str, int]]:
-        scores = self.data_manager.get_names(column).apply(
-            lambda x: DamerauLevenshtein.normalized_similarity(name, x) * 100
-        )
-        top_indices = scores.nlargest(self.top_k).index
-        matches = [
-            (
-                self.data_manager.names_df.at[idx, column],
-                scores.at[idx],
-                self.data_manager.names_df.at[idx, 'english_name'],
-                idx
-            )
-            for idx in top_indices
-        ]
-        if self.debug:
-            logging.info(f"[Damerau-Levenshtein] Name: {name}, Matches: {matches}")
-        return matches
+        """Top-k matches of a preprocessed name in one column for the given scorer."""
+        choices = self._choices[column]
+        if scorer in self._TRIGRAMS_PER_EDIT and len(choices) >= PRUNED_SEARCH_MIN_ROWS:
+            top_scores, top_indices = self._search_by_length(name, column, scorer, self.top_k)
+            return self._select_top_k(top_scores, column, top_indices)
+        scores = process.cdist(
+            [name], choices,
+            scorer=scorer, processor=None, dtype=np.float32, workers=-1
+        )[0]
+        return self._select_top_k(scores, column)
 
-    def _get_top_matches_jaro_winkler(
+    def _select_top_k(
             self,
-            name: str,
-            column: str
+            scores: np.ndarray,
+            column: str,
+            indices: Optional[np.ndarray] = None
     ) -> List[Tuple[str, float, str, int]]:
-        scores = self.data_manager.get_names(column).apply(
-            lambda x: JaroWinkler.similarity(name, x) * 100
-        )
-        top_indices = scores.nlargest(self.top_k).index
-        matches = [
-            (
-                self.data_manager.names_df.at[idx, column],
-                scores.at[idx],
-                self.data_manager.names_df.at[idx, 'english_name'],
-                idx
-            )
-            for idx in top_indices
-        ]
-        if self.debug:
-            logging.info(f"[Jaro-Winkler] Name: {name}, Matches: {matches}")
-        return matches
+        """
+        Pick the top-k rows of a score vector in O(N), ties broken by row order.
 
+        :param scores: Similarity scores (0-1) for the scored rows of the column.
+        :param column: Column the scores were computed against.
+        :param indices: Row indices of the scores; defaults to every row in order.
+        :return: List of tuples containing matched name, score, english name, and index.
+        """
+        if indices is None:
+            indices = np.arange(len(scores))
+        top_scores, top = _top_k(scores, indices, self.top_k)
+        return list(zip(
+            self.data_manager.get_name_array(column)[top].tolist(),
+            (top_scores * 100).tolist(),
+            self.data_manager.get_name_array('english_name')[top].tolist(),
+            top.tolist()
+        ))
+
+    def _search_by_length(
+            self,
+            name: str,
+            column: str,
+            scorer: Callable[..., float],
+            k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k search for normalized edit-distance scorers, scanning length buckets best-first.
+
+        The edit distance between strings of lengths a and b is at least |a - b|, so a
+        bucket's similarity is bounded by 1 - |a - b| / max(a, b). Buckets are scanned in
+        decreasing order of that bound, and the scan stops once no remaining bucket can
+        beat the current kth-best score. `name` must already be preprocessed.
+
+        Within a bucket, rows sharing no trigram with the name are further bounded by the
+        q-gram lemma: each edit destroys at most g trigrams of the longer string, so such
+        rows are at least ceil((max(a, b) - 2) / g) edits away. Once that bound falls
+        below the kth-best score only the rows sharing a trigram need to be scored.
+        """
+        buckets = self.data_manager.get_length_buckets(column)
+        per_edit = self._TRIGRAMS_PER_EDIT[scorer]
+
+        def bound(length: int, blocked: bool = False) -> float:
+            longest = max(length, len(name))
+            if longest == 0:
+                return 1.0
+            distance = abs(length - len(name))
+            if blocked:
+                distance = max(distance, -(-(longest - 2) // per_edit))
+            return 1 - distance / longest
+
+        index = self.data_manager.get_trigram_index(column)
+        postings = [index[gram] for gram in _trigrams(name) if gram in index]
+        candidates = np.unique(np.concatenate(postings)) if postings else np.empty(0, dtype=np.intp)
+        lengths, positions = self.data_manager.get_bucket_positions(column)
+        candidate_lengths = lengths[candidates]
+        candidate_positions = positions[candidates]
+
+        top_scores = np.empty(0, dtype=np.float32)
+        top_indices = np.empty(0, dtype=np.intp)
+        for length in sorted(buckets, key=bound, reverse=True):
+            full = len(top_scores) == k
+            # Small slack so float rounding never drops a tie at the kth score
+            cutoff = max(0.0, float(top_scores[-1]) - 1e-6) if full else 0.0
+            if full and bound(length) < cutoff:
+                break
+            names, indices = buckets[length]
+            if full and bound(length, blocked=True) < cutoff:
+                # Only rows sharing a trigram can still make the top k
+                selected = candidate_positions[candidate_lengths == length]
+                if not len(selected):
+                    continue
+                names = [names[pos] for pos in selected.tolist()]
+                indices = indices[selected]
+            scores = process.cdist(
+                [name], names, scorer=scorer, processor=None,
+                dtype=np.float32, workers=1, score_cutoff=cutoff
+            )[0]
+            if full:
+                # Rows under the cutoff were zeroed and cannot place; drop them before ranking
+                keep = np.flatnonzero(scores >= cutoff)
+                scores, indices = scores[keep], indices[keep]
+            top_scores, top_indices = _top_k(
+                np.concatenate([top_scores, scores]),
+                np.concatenate([top_indices, indices]),
+                k
+            )
+        return top_scores, top_indices
 
 
 class NameService:
     """Service to get English writing of names from various languages."""
     
     def __init__(self):
-        self.data_manager = DataManager(names_file='src/dataset/persian-gender-by-name.csv')    
+        self.data_manager = get_data_manager('src/dataset/persian-gender-by-name.csv')
         self.name_matcher = NameMatcher(data_manager=self.data_manager)
         
     def get_english_name(self, name: str) -> str:
@@ -143,12 +413,17 @@ class NameService:
         Get English writing of a name.
         Returns the English equivalent or the original if already in English.
         """
-        native_matches = self.name_matcher.get_top_matches(name = name, lang = NATIVE_LANG)
-        print(f"native: {native_matches}")
-        english_mathces = self.name_matcher.get_top_matches(name = name, lang = 'english_name')
-        print(f"english: {english_mathces}")
-        
-        
-        top_match = sorted(english_mathces + native_matches, key=lambda x: x[1], reverse=True)[0]
-        return top_match[2]
-            
+        # ASCII input can only match the English column, anything else only the native one
+        lang = 'en' if name.isascii() and name.strip() else NATIVE_LANG
+        # A canonical spelling is its own best match, so skip the scan entirely
+        match = self.name_matcher.get_exact_match(name=name, lang=lang)
+        if match is None:
+            match = self.name_matcher.get_top_matches(name=name, lang=lang)[0]
+        return match[2]
+
+    async def aget_english_name(self, name: str) -> str:
+        """
+        Async variant of get_english_name.
+        Runs the matching scan in a worker thread so it does not block the event loop.
+        """
+        return await asyncio.to_thread(self.get_english_name, name)
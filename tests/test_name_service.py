@@ -0,0 +1,105 @@
+import csv
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein, DamerauLevenshtein
+
+import src.services.name_service as name_service
+from src.services.name_service import DataManager, NameMatcher, _top_k
+
+LATIN = "abcdefghijklmnopqrstuvwxyz"
+PERSIAN = "ابپتثجچحخدذرزژسشصضطظعغفقکگلمنوهی"
+
+
+def _random_name(rng: random.Random, alphabet: str) -> str:
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 12)))
+
+
+def _typo(rng: random.Random, name: str, alphabet: str) -> str:
+    """Apply one random edit: delete, insert, substitute or swap two neighbours."""
+    if not name:
+        return rng.choice(alphabet)
+    i = rng.randrange(len(name))
+    op = rng.randrange(4)
+    if op == 0:
+        return name[:i] + name[i + 1:]
+    if op == 1:
+        return name[:i] + rng.choice(alphabet) + name[i:]
+    if op == 2 or i == len(name) - 1:
+        return name[:i] + rng.choice(alphabet) + name[i + 1:]
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+class PrunedSearchTest(unittest.TestCase):
+    """The length/trigram-pruned search must agree with a brute-force scan."""
+
+    ROWS = 3000
+
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(7)
+        rows = []
+        for _ in range(cls.ROWS):
+            english = _random_name(rng, LATIN).capitalize()
+            native = _random_name(rng, PERSIAN)
+            # Near-duplicates and exact duplicates exercise the tie-breaking
+            if rows and rng.random() < 0.2:
+                english = _typo(rng, rows[-1][1], LATIN)
+                native = rows[-1][0] if rng.random() < 0.5 else _typo(rng, rows[-1][0], PERSIAN)
+            rows.append((native, english, rng.choice("MF")))
+
+        cls._tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(cls._tmp.name, "names.csv")
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["name", "english_name", "gender"])
+            writer.writerows(rows)
+        cls.matcher = NameMatcher(DataManager(path), debug=False)
+
+        cls.queries = {}
+        for column, alphabet in (("english_name", LATIN), ("name", PERSIAN)):
+            names = cls.matcher._choices[column]
+            queries = [_typo(rng, rng.choice(names), alphabet) for _ in range(150)]
+            queries += [rng.choice(names) for _ in range(20)]
+            queries += ["", alphabet[0], alphabet[:2], _random_name(rng, alphabet) * 3]
+            cls.queries[column] = queries
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._tmp.cleanup()
+
+    def _brute_force(self, query, column, scorer, k):
+        scores = process.cdist(
+            [query], self.matcher._choices[column],
+            scorer=scorer, processor=None, dtype=np.float32
+        )[0]
+        return _top_k(scores, np.arange(len(scores)), k)
+
+    def test_matches_brute_force(self):
+        for column, queries in self.queries.items():
+            for scorer in (Levenshtein.normalized_similarity, DamerauLevenshtein.normalized_similarity):
+                for k in (1, 3, 5):
+                    for query in queries:
+                        with self.subTest(column=column, scorer=scorer, k=k, query=query):
+                            expected_scores, expected_indices = self._brute_force(query, column, scorer, k)
+                            scores, indices = self.matcher._search_by_length(query, column, scorer, k)
+                            np.testing.assert_array_equal(indices, expected_indices)
+                            np.testing.assert_allclose(scores, expected_scores, rtol=0, atol=1e-6)
+
+    def test_routing_does_not_change_results(self):
+        for column, queries in self.queries.items():
+            for query in queries[:40]:
+                with self.subTest(column=column, query=query):
+                    flat = self.matcher._get_top_matches(query, column, Levenshtein.normalized_similarity)
+                    with mock.patch.object(name_service, "PRUNED_SEARCH_MIN_ROWS", 0):
+                        pruned = self.matcher._get_top_matches(query, column, Levenshtein.normalized_similarity)
+                    self.assertEqual([m[3] for m in pruned], [m[3] for m in flat])
+
+
+if __name__ == "__main__":
+    unittest.main()